@@ -1,98 +1,550 @@
-from flask import Flask, render_template, request, redirect, url_for
+from flask import Flask, render_template, request, redirect, url_for, make_response
+from flask_compress import Compress
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
-import pandas as pd
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import numpy as np
 import random
 import os
+import fcntl
+import tempfile
+import contextlib
 import json
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib parser
+    orjson = None
+import hashlib
+import logging
 import time
+import threading
+import atexit
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 app = Flask(__name__)
+# Templates don't change once deployed, so skip the per-render mtime check
+app.config['TEMPLATES_AUTO_RELOAD'] = False
+Compress(app)
+
+# --- Logging ---
+logging.basicConfig(format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger('hotornot')
+_log_level = os.getenv('LOG_LEVEL', 'WARNING').upper()
+# Accept level names or numbers; anything else falls back instead of failing the import
+_log_level = int(_log_level) if _log_level.isdigit() else logging.getLevelName(_log_level)
+if not isinstance(_log_level, int):
+    logger.warning("Unknown LOG_LEVEL %r, using WARNING", os.getenv('LOG_LEVEL'))
+    _log_level = logging.WARNING
+logger.setLevel(_log_level)
 
 # --- In-Memory Cache ---
 _cache = {}
-_cache_time = 0
-CACHE_DURATION = 300  # Cache duration in seconds (5 minutes)
+_cache_lock = threading.Lock()
+_refresh_thread = None
+CACHE_DURATION = 300  # Seconds between background refreshes (5 minutes)
+_EMPTY_ARRAY = np.array([], dtype=object)
+
+# --- Shared Google Sheets Client ---
+_client_singleton = None
+_spreadsheet = None
+_tweets_ws = None
+_votes_ws = None
+_client_lock = threading.Lock()
+
+# --- Buffered Vote Writes ---
+_vote_buffer = []
+_vote_lock = threading.Lock()
+_flush_timer = None
+_flush_lock = threading.Lock()  # Held while buffered votes are on their way to the sheet
+_flush_failed = False  # Whether the last write attempt failed
+# Bumped under _vote_lock when an append_rows call starts and again when it ends, so
+# it's odd while rows are in flight and any change means the sheet may have moved
+_flush_epoch = 0
+# Seconds to wait before writing buffered votes; 0 writes them in the request thread.
+# Serverless instances (Vercel sets VERCEL=1) are frozen between requests, so timers
+# never fire and atexit never runs there; default to writing synchronously.
+try:
+    VOTE_FLUSH_INTERVAL = float(os.getenv('VOTE_FLUSH_INTERVAL', 0 if os.getenv('VERCEL') else 2))
+except ValueError:
+    VOTE_FLUSH_INTERVAL = 2
+VOTE_FLUSH_SIZE = 20  # Write immediately once this many votes are buffered
+_executor = ThreadPoolExecutor(max_workers=1)  # Runs full-buffer flushes off the request thread, one at a time
+# Append-only log of votes not yet written to Sheets, replayed on startup. This only
+# survives restarts on long-lived hosts where VOTE_LOG_PATH is on durable storage: the
+# temp dir default is wiped when a serverless instance (e.g. Vercel) is recycled, which
+# is why those deployments write votes synchronously instead (see VOTE_FLUSH_INTERVAL).
+VOTE_LOG_PATH = os.getenv('VOTE_LOG_PATH', os.path.join(tempfile.gettempdir(), 'hotornot_votes.log'))
+# The log itself is replaced on rewrite, so its lock lives in a separate file
+_VOTE_LOG_LOCK_PATH = VOTE_LOG_PATH + '.lock'
+# Every process using the log holds a shared lock on this file for as long as it runs
+_VOTE_LOG_LIVE_PATH = VOTE_LOG_PATH + '.live'
+_live_file = None
+_vote_log_enabled = False  # Set once open_vote_log() has joined the log
+
+# --- Admin Score Cache ---
+_admin_cache = {'t': 0, 'scores': Counter(), 'pairwise': defaultdict(Counter)}
+_admin_lock = threading.Lock()
+ADMIN_TTL = 60  # Seconds before scores are rebuilt from the 'Votes' worksheet
+
+def _json_loads(data):
+    """Parses JSON with orjson when it's installed, otherwise the stdlib."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _json_dumps(obj):
+    """Serializes JSON with orjson when it's installed, otherwise the stdlib."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj)
 
 # --- Google Sheets Setup ---
 def get_google_sheets_client():
-    """Establishes connection with Google Sheets."""
-    print("--- Attempting to get Google Sheets client ---")
+    """Returns a shared Google Sheets client, authorizing it on first use."""
+    global _client_singleton, _spreadsheet, _tweets_ws, _votes_ws
+
+    # gspread's authorized session refreshes its access token on its own, so the
+    # client stays valid until invalidate_on_auth_error() drops it
+    client = _client_singleton
+    if client is not None:
+        return client
+
+    with _client_lock:
+        # Another thread may have authorized while we waited for the lock
+        if _client_singleton is not None:
+            return _client_singleton
+
+        _spreadsheet, _tweets_ws, _votes_ws = None, None, None
+
+        creds = _load_credentials()
+        if creds is None:
+            return None
+        try:
+            client = gspread.authorize(creds)
+            _configure_session(client)
+            logger.info("Successfully authorized Google Sheets client")
+        except Exception as e:
+            logger.error("CRITICAL ERROR in get_google_sheets_client: %s", e)
+            return None
+
+        _client_singleton = client
+        return client
+
+def _configure_session(client):
+    """Gives the client's HTTP session a connection pool and retries for transient errors."""
+    # gspread 6 keeps its requests.Session on the HTTP client
+    session = getattr(client, 'http_client', client).session
+    # Only idempotent requests are retried, so appends are never duplicated
+    retry = Retry(total=3, backoff_factor=0.2, status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False)
+    session.mount('https://', HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=retry))
+
+def _load_credentials():
+    """Builds service account credentials from the environment."""
+    logger.debug("Attempting to get Google Sheets client")
     try:
         creds_json = os.getenv('GOOGLE_SHEETS_CREDENTIALS')
         if not creds_json:
-            print("!!! ERROR: GOOGLE_SHEETS_CREDENTIALS environment variable not found or is empty.")
+            logger.error("GOOGLE_SHEETS_CREDENTIALS environment variable not found or is empty.")
             return None
         
-        print(f"--- Found credentials of type {type(creds_json)} and length {len(creds_json)} ---")
-        creds_dict = json.loads(creds_json)
+        logger.debug("Found credentials of type %s and length %d", type(creds_json), len(creds_json))
+        creds_dict = _json_loads(creds_json)
         scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
-        creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-        client = gspread.authorize(creds)
-        print("--- Successfully authorized Google Sheets client ---")
-        return client
+        return ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
     except Exception as e:
-        print(f"!!! CRITICAL ERROR in get_google_sheets_client: {e}")
+        logger.error("CRITICAL ERROR in _load_credentials: %s", e)
         return None
 
-def get_sheets_data():
-    """Fetches and processes data from Google Sheets, with caching."""
-    global _cache, _cache_time
-
-    # Check if cache is still valid
-    if _cache and (time.time() - _cache_time < CACHE_DURATION):
-        print("--- Using cached data ---")
-        return _cache.get('tweet_lookup', {}), _cache.get('tweet_ids', [])
+def get_spreadsheet():
+    """Returns the shared 'HotOrNotTweets' spreadsheet, opening it on first use."""
+    global _spreadsheet
 
-    print("--- Cache expired or empty, fetching new data ---")
     client = get_google_sheets_client()
     if not client:
-        print("!!! ERROR: Could not get Google Sheets client. Aborting data fetch.")
-        return {}, []
+        return None
+
+    spreadsheet = _spreadsheet
+    if spreadsheet is not None:
+        return spreadsheet
 
+    with _client_lock:
+        if _spreadsheet is None and client is _client_singleton:
+            try:
+                logger.debug("Opening spreadsheet 'HotOrNotTweets'")
+                _spreadsheet = client.open("HotOrNotTweets")
+            except Exception as e:
+                logger.error("Error opening spreadsheet 'HotOrNotTweets': %s", e)
+                return None
+        return _spreadsheet
+
+def get_worksheets():
+    """Returns the shared ('Tweets', 'Votes') worksheet handles, opening them on first use."""
+    global _tweets_ws, _votes_ws
+
+    spreadsheet = get_spreadsheet()
+    if not spreadsheet:
+        return None, None
+
+    if _tweets_ws is not None and _votes_ws is not None:
+        return _tweets_ws, _votes_ws
+
+    with _client_lock:
+        if (_tweets_ws is None or _votes_ws is None) and spreadsheet is _spreadsheet:
+            try:
+                _tweets_ws = spreadsheet.worksheet("Tweets")
+                _votes_ws = spreadsheet.worksheet("Votes")
+            except Exception as e:
+                logger.error("Error opening worksheets: %s", e)
+                _tweets_ws, _votes_ws = None, None
+        return _tweets_ws, _votes_ws
+
+def invalidate_on_auth_error(error):
+    """Drops the shared client and sheet handles if Google rejected our credentials."""
+    global _client_singleton, _spreadsheet, _tweets_ws, _votes_ws
+
+    if not isinstance(error, gspread.exceptions.APIError):
+        return
+    if getattr(error, 'code', None) not in (401, 403):
+        return
+
+    logger.warning("Google Sheets returned %s, dropping cached client", error.code)
+    with _client_lock:
+        _client_singleton, _spreadsheet = None, None
+        _tweets_ws, _votes_ws = None, None
+
+def _schedule_flush():
+    """Starts the flush timer if one isn't pending. Caller must hold _vote_lock."""
+    global _flush_timer
+
+    # In synchronous mode the next request's flush picks up anything left over
+    if VOTE_FLUSH_INTERVAL <= 0:
+        return
+    if _flush_timer is None:
+        _flush_timer = threading.Timer(VOTE_FLUSH_INTERVAL, flush_votes)
+        _flush_timer.daemon = True
+        _flush_timer.start()
+
+@contextlib.contextmanager
+def _vote_log_lock():
+    """Holds the exclusive lock that guards the vote log across workers."""
+    with open(_VOTE_LOG_LOCK_PATH, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+def _log_vote(row):
+    """Appends a vote to the on-disk log."""
+    if not _vote_log_enabled:
+        return
     try:
-        print("--- Opening spreadsheet 'HotOrNotTweets' ---")
-        sheet = client.open("HotOrNotTweets").worksheet("Tweets")
-        print("--- Getting all records from 'Tweets' worksheet ---")
-        data = sheet.get_all_records()
-        if not data:
-            print("!!! WARNING: No data found in 'Tweets' worksheet.")
-            return {}, []
-        print(f"--- Found {len(data)} records in sheet. ---")
-        df = pd.DataFrame(data)
-        df.columns = ['id', 'text']
-        df['id'] = df['id'].astype(str)
-        df['text'] = df['text'].str.strip()
-        
-        tweet_lookup = pd.Series(df.text.values, index=df.id).to_dict()
-        tweet_ids = df['id'].tolist()
+        with _vote_log_lock(), open(VOTE_LOG_PATH, 'a') as f:
+            f.write(_json_dumps(row) + '\n')
+    except OSError as e:
+        logger.error("Error writing vote to %s: %s", VOTE_LOG_PATH, e)
+
+def _read_vote_log():
+    """Returns the vote log's entries. Caller must hold _vote_log_lock()."""
+    entries = []
+    try:
+        with open(VOTE_LOG_PATH) as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return entries
+    for line in lines:
+        try:
+            entry = _json_loads(line)
+        except ValueError:
+            entry = None
+        # A crash mid-write can leave a partial last line
+        if not isinstance(entry, list) or len(entry) != 3:
+            logger.warning("Skipping corrupt line in %s: %r", VOTE_LOG_PATH, line)
+            continue
+        entries.append(entry)
+    return entries
+
+def _rewrite_vote_log(edit):
+    """Replaces the vote log's entries with edit(entries).
+
+    The new log is written and fsynced to a temp file that is then renamed over
+    the old one, so a crash or a failed write leaves the previous log intact.
+    """
+    if not _vote_log_enabled:
+        return
+    try:
+        with _vote_log_lock():
+            entries = edit(_read_vote_log())
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(VOTE_LOG_PATH)),
+                                            prefix=os.path.basename(VOTE_LOG_PATH) + '.')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.writelines(_json_dumps(entry) + '\n' for entry in entries)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, VOTE_LOG_PATH)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+    except OSError as e:
+        logger.error("Error updating %s: %s", VOTE_LOG_PATH, e)
+
+def open_vote_log():
+    """Starts logging votes to disk, replaying any left over if no other process is using the log.
+
+    Entries don't record which process wrote them, so leftovers can only be told
+    apart from a running worker's pending votes when no other worker is running.
+    If one is, the leftovers wait for a later startup when none are.
+    """
+    global _live_file, _vote_log_enabled
+
+    # Synchronous writes leave nothing buffered to recover, and on serverless hosts
+    # the log wouldn't outlive the instance anyway
+    if VOTE_FLUSH_INTERVAL <= 0:
+        return
+    try:
+        with _vote_log_lock():
+            live_file = open(_VOTE_LOG_LIVE_PATH, 'a')
+            try:
+                fcntl.flock(live_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                alone = True
+            except BlockingIOError:
+                alone = False
+            # Stay marked as running; other processes only probe under _vote_log_lock()
+            fcntl.flock(live_file, fcntl.LOCK_SH)
+            leftovers = _read_vote_log() if alone else []
+    except OSError as e:
+        logger.error("Vote log disabled, can't use %s: %s", VOTE_LOG_PATH, e)
+        return
+
+    _live_file, _vote_log_enabled = live_file, True
+    if leftovers:
+        # They stay in the log until flushed, so a crash before then replays them again
+        logger.warning("Replaying %d unflushed votes from %s", len(leftovers), VOTE_LOG_PATH)
+        with _vote_lock:
+            _vote_buffer[:0] = leftovers
+            _schedule_flush()
+
+def queue_vote(row):
+    """Buffers a vote row to be written to the 'Votes' worksheet in a batch."""
+    # Outside _vote_lock so voters don't queue behind another process's log rewrite
+    _log_vote(row)
+    with _vote_lock:
+        _vote_buffer.append(row)
+        # Same lock as the buffer, so a rebuild counts this vote exactly once
+        if row[2] != 'tie':
+            record_win(row[2], row[0] if row[1] == row[2] else row[1])
+        # Only start an early flush if none is running and the last one worked;
+        # during an outage the timer paces the retries instead
+        flush_now = len(_vote_buffer) >= VOTE_FLUSH_SIZE and not _flush_failed and not _flush_lock.locked()
+        if not flush_now:
+            _schedule_flush()
 
-        # Update cache
-        _cache = {'tweet_lookup': tweet_lookup, 'tweet_ids': tweet_ids}
-        _cache_time = time.time()
+    if VOTE_FLUSH_INTERVAL <= 0:
+        flush_votes()
+    elif flush_now:
+        _executor.submit(flush_votes)
 
-        return tweet_lookup, tweet_ids
+def flush_votes():
+    """Writes all buffered votes with a single append_rows call."""
+    with _flush_lock:
+        _flush_votes()
+
+def _flush_votes():
+    """Does the work of flush_votes(). Caller must hold _flush_lock."""
+    global _vote_buffer, _flush_timer, _flush_failed, _flush_epoch
+
+    with _vote_lock:
+        rows, _vote_buffer = _vote_buffer, []
+        if _flush_timer is not None:
+            _flush_timer.cancel()
+            _flush_timer = None
+        if not rows:
+            return
+        _flush_epoch += 1
+
+    try:
+        _, sheet = get_worksheets()
+        if not sheet:
+            raise RuntimeError("Could not get 'Votes' worksheet")
+        sheet.append_rows(rows, value_input_option='RAW')
+        logger.debug("Flushed %d buffered votes", len(rows))
+        with _vote_lock:
+            _flush_failed = False
+            _flush_epoch += 1
     except Exception as e:
-        print(f"!!! CRITICAL ERROR in get_sheets_data: {e}")
-        return {}, []
+        logger.error("Error writing buffered votes to sheet: %s", e)
+        invalidate_on_auth_error(e)
+        # Put the rows back in front of anything queued meanwhile and retry later
+        with _vote_lock:
+            _flush_failed = True
+            _flush_epoch += 1
+            _vote_buffer[:0] = rows
+            _schedule_flush()
+        return
+
+    flushed = Counter(tuple(row) for row in rows)
+
+    def drop_flushed(entries):
+        kept = []
+        for entry in entries:
+            row = tuple(entry)
+            # Identical votes are interchangeable, so any matching entry will do
+            if flushed[row] > 0:
+                flushed[row] -= 1
+            else:
+                kept.append(entry)
+        return kept
+
+    _rewrite_vote_log(drop_flushed)
+
+# atexit runs these in reverse, so pending flushes finish before the final one
+atexit.register(flush_votes)
+atexit.register(_executor.shutdown)
+
+def record_win(winner_id, loser_id):
+    """Applies a single win to the cached admin scores."""
+    with _admin_lock:
+        _admin_cache['scores'][winner_id] += 1
+        _admin_cache['pairwise'][winner_id][loser_id] += 1
+
+def update_admin_cache(vote_rows, epoch):
+    """Rebuilds the cached admin scores from the 'Votes' worksheet rows.
+
+    epoch is _flush_epoch as read before vote_rows were fetched. If a flush was
+    in flight or finished meanwhile, we can't tell whether its rows are in
+    vote_rows, so the rebuild is skipped and the incrementally kept cache stays
+    until the next TTL.
+    """
+    global _admin_cache
+
+    scores = Counter()
+    pairwise_wins = defaultdict(Counter)
+
+    def count(rows):
+        for id1, id2, result in rows:
+            # Filter out ties, count only explicit wins
+            if result != 'tie':
+                scores[result] += 1
+                pairwise_wins[result][id1 if id2 == result else id2] += 1
+
+    # Columns are id1, id2, result
+    count(row[:3] for row in vote_rows if len(row) >= 3)
+
+    # Votes still waiting in the write buffer aren't in the sheet yet. Holding
+    # _vote_lock until the swap means queue_vote() can't also record_win() one
+    # of them into the cache we're replacing.
+    with _vote_lock:
+        if epoch % 2 or epoch != _flush_epoch:
+            logger.debug("Votes were flushed during the read, keeping cached admin scores")
+            # The incremental counts are still exact; try reconciling again next TTL
+            with _admin_lock:
+                _admin_cache['t'] = time.time()
+            return
+        count(_vote_buffer)
+        with _admin_lock:
+            _admin_cache = {'t': time.time(), 'scores': scores, 'pairwise': pairwise_wins}
+
+def refresh_sheets_data(force=True):
+    """Fetches tweets and votes from Google Sheets and swaps them into the caches."""
+    global _cache
+
+    with _cache_lock:
+        # Someone else filled the cache while we waited for the lock
+        if not force and _cache:
+            return
+
+        logger.debug("Refreshing tweet and vote caches")
+        try:
+            spreadsheet = get_spreadsheet()
+            if not spreadsheet:
+                logger.error("Could not get Google Sheets client. Aborting data fetch.")
+                return
+
+            # Read both worksheets in a single batchGet round trip
+            logger.debug("Getting all values from 'Tweets' and 'Votes' worksheets")
+            epoch = _flush_epoch
+            tweet_range, vote_range = spreadsheet.values_batch_get(ranges=["Tweets!A:B", "Votes!A:C"])['valueRanges']
+            # Skip the header rows; empty ranges have no 'values' key
+            update_admin_cache(vote_range.get('values', [])[1:], epoch)
+            rows = tweet_range.get('values', [])[1:]
+            if not rows:
+                logger.warning("No data found in 'Tweets' worksheet.")
+                return
+            logger.debug("Found %d records in sheet.", len(rows))
+            # The first two columns hold the id and text
+            tweet_lookup = {}
+            for row in rows:
+                if len(row) >= 2:
+                    tweet_lookup[row[0]] = row[1].strip()
+            # Packed parallel arrays for positional access when picking a random pair
+            tweet_ids = np.array(list(tweet_lookup.keys()))
+            tweet_texts = np.array(list(tweet_lookup.values()), dtype=object)
+
+            # Swap in a new dict so readers never see a half-updated cache
+            _cache = {'tweet_lookup': tweet_lookup, 'tweet_ids': tweet_ids, 'tweet_texts': tweet_texts}
+        except Exception as e:
+            logger.error("CRITICAL ERROR in refresh_sheets_data: %s", e)
+            invalidate_on_auth_error(e)
+
+def _refresh_loop():
+    """Periodically refreshes the caches so requests never wait on them."""
+    # Warm the caches at startup unless a request already beat us to it
+    refresh_sheets_data(force=False)
+    while True:
+        # Jitter keeps replicas from all hitting the Sheets API at once
+        time.sleep(random.uniform(0.8, 1.2) * CACHE_DURATION)
+        refresh_sheets_data()
+
+def start_refresh_thread():
+    """Starts the background tweet refresher if it isn't already running."""
+    global _refresh_thread
+
+    if _refresh_thread is not None:
+        return
+    with _cache_lock:
+        if _refresh_thread is None:
+            _refresh_thread = threading.Thread(target=_refresh_loop, daemon=True)
+            _refresh_thread.start()
+
+def _get_cache():
+    """Returns the tweet cache, fetching it on first use."""
+    cache = _cache
+    if not cache:
+        logger.debug("Cache empty, fetching new data")
+        refresh_sheets_data(force=False)
+        cache = _cache
+    return cache
+
+def get_sheets_data():
+    """Returns the cached tweet id and text arrays, fetching them on first use."""
+    cache = _get_cache()
+    return cache.get('tweet_ids', _EMPTY_ARRAY), cache.get('tweet_texts', _EMPTY_ARRAY)
+
+def get_tweet_lookup():
+    """Returns the cached {id: text} tweet lookup, fetching it on first use."""
+    return _get_cache().get('tweet_lookup', {})
 
 @app.route('/')
 def index():
-    print("--- INDEX ROUTE HIT ---")
-    tweet_lookup, tweet_ids = get_sheets_data()
+    logger.debug("INDEX ROUTE HIT")
+    tweet_ids, tweet_texts = get_sheets_data()
 
     if len(tweet_ids) < 2:
-        print("--- Not enough tweet IDs found, showing error page. ---")
+        logger.warning("Not enough tweet IDs found, showing error page.")
         return "Not enough tweets to compare. Please check your Google Sheet."
     
-    id1, id2 = random.sample(tweet_ids, 2)
-    tweet1 = {'id': id1, 'text': tweet_lookup.get(id1, "Tweet text not found.")}
-    tweet2 = {'id': id2, 'text': tweet_lookup.get(id2, "Tweet text not found.")}
+    # Two distinct indexes: draw j from the n-1 slots left after i, then skip over i
+    n = len(tweet_ids)
+    i = random.randrange(n)
+    j = random.randrange(n - 1)
+    j += j >= i
+    tweet1 = {'id': str(tweet_ids[i]), 'text': tweet_texts[i]}
+    tweet2 = {'id': str(tweet_ids[j]), 'text': tweet_texts[j]}
     return render_template('index.html', tweet1=tweet1, tweet2=tweet2)
 
 @app.route('/test')
 def test():
-    print("--- TEST ROUTE HIT ---")
+    logger.debug("TEST ROUTE HIT")
     return "This is the test page. If you can see this, the Python function is running!"
 
 @app.route('/vote', methods=['POST'])
@@ -100,15 +552,9 @@ def vote():
     winner_id = request.form['winner']
     loser_id = request.form['loser']
     
-    client = get_google_sheets_client()
-    if client:
-        try:
-            sheet = client.open("HotOrNotTweets").worksheet("Votes")
-            # New format: id1, id2, result (winner_id)
-            sheet.append_row([winner_id, loser_id, winner_id])
-        except Exception as e:
-            print(f"Error writing to sheet: {e}")
-            
+    # New format: id1, id2, result (winner_id)
+    queue_vote([winner_id, loser_id, winner_id])
+
     return redirect(url_for('index'))
 
 @app.route('/tie', methods=['POST'])
@@ -116,47 +562,78 @@ def tie():
     tweet1_id = request.form['tweet1']
     tweet2_id = request.form['tweet2']
 
-    client = get_google_sheets_client()
-    if client:
-        try:
-            sheet = client.open("HotOrNotTweets").worksheet("Votes")
-            # New format: id1, id2, result ('tie')
-            sheet.append_row([tweet1_id, tweet2_id, 'tie'])
-        except Exception as e:
-            print(f"Error writing tie to sheet: {e}")
+    # New format: id1, id2, result ('tie')
+    queue_vote([tweet1_id, tweet2_id, 'tie'])
 
     return redirect(url_for('index'))
 
 @app.route('/admin')
 def admin():
-    scores, pairwise_wins = {}, {}
-    client = get_google_sheets_client()
-    if client:
-        try:
-            sheet = client.open("HotOrNotTweets").worksheet("Votes")
-            votes_data = sheet.get_all_records() # Use get_all_records for header mapping
-            
-            if votes_data:
-                votes_df = pd.DataFrame(votes_data)
-                # Filter out ties, count only explicit wins
-                wins_df = votes_df[votes_df['result'] != 'tie']
-                scores = wins_df['result'].value_counts().to_dict()
-
-                # Adjust pairwise wins to handle new structure
-                pairwise_wins = {}
-                for index, row in wins_df.iterrows():
-                    winner = row['result']
-                    loser = row['id1'] if row['id2'] == winner else row['id2']
-                    if winner not in pairwise_wins:
-                        pairwise_wins[winner] = []
-                    pairwise_wins[winner].append(loser)
+    # A cold start fetches tweets and votes together, which also fills the admin cache
+    tweet_lookup = get_tweet_lookup()
 
-        except Exception as e:
-            print(f"Error reading votes from sheet: {e}")
+    if time.time() - _admin_cache['t'] > ADMIN_TTL:
+        _, sheet = get_worksheets()
+        if sheet:
+            try:
+                epoch = _flush_epoch
+                # Skip the header row
+                update_admin_cache(sheet.get_all_values()[1:], epoch)
+            except Exception as e:
+                logger.error("Error reading votes from sheet: %s", e)
+                invalidate_on_auth_error(e)
 
-    sorted_tweets = sorted(scores.items(), key=lambda x: x[1], reverse=True)
-    
-    return render_template('admin.html', scores=sorted_tweets, pairwise_wins=pairwise_wins)
+    with _admin_lock:
+        sorted_tweets = _admin_cache['scores'].most_common()
+        # (loser, times beaten) pairs, most frequent first
+        pairwise_wins = {winner: losers.most_common() for winner, losers in _admin_cache['pairwise'].items()}
+
+    tweet_texts = {tweet: tweet_lookup.get(tweet, "Tweet text not found.") for tweet, _ in sorted_tweets}
+
+    # Identical rankings render identical pages, so let the browser revalidate cheaply
+    etag = hashlib.md5(repr((sorted_tweets, pairwise_wins, tweet_texts)).encode()).hexdigest()
+    # Flask-Compress suffixes the ETag with the encoding, e.g. "<hash>:gzip"
+    matched = next((tag for tag in request.if_none_match if tag.split(':')[0] == etag), None)
+    if matched is not None:
+        # Echo the validator the client holds, encoding suffix included
+        resp = make_response('', 304)
+        resp.set_etag(matched)
+    else:
+        resp = make_response(render_template('admin.html', scores=sorted_tweets, pairwise_wins=pairwise_wins, tweet_texts=tweet_texts))
+        resp.set_etag(etag)
+    resp.headers['Cache-Control'] = f'private, max-age={ADMIN_TTL}'
+    return resp
+
+# Compile the templates once at boot instead of on the first request
+for template_name in ('index.html', 'admin.html'):
+    app.jinja_env.get_template(template_name)
+
+@app.before_request
+def _ensure_refresh_thread():
+    # A worker forked from a preloaded app doesn't inherit the parent's thread
+    start_refresh_thread()
+
+def _reset_after_fork():
+    """Gives a forked worker its own locks, threads and Sheets connection."""
+    global _vote_buffer, _flush_timer, _flush_failed, _flush_epoch, _executor
+    global _vote_lock, _flush_lock, _cache_lock, _client_lock, _admin_lock
+    global _refresh_thread, _client_singleton, _spreadsheet, _tweets_ws, _votes_ws
+
+    # Buffered votes and their log entries still belong to the parent
+    _vote_buffer, _flush_timer, _flush_failed, _flush_epoch = [], None, False, 0
+    # A parent thread may have held these at fork time, and only the forking thread survives
+    _vote_lock, _flush_lock = threading.Lock(), threading.Lock()
+    _cache_lock, _client_lock, _admin_lock = threading.Lock(), threading.Lock(), threading.Lock()
+    _executor = ThreadPoolExecutor(max_workers=1)
+    atexit.register(_executor.shutdown)
+    _refresh_thread = None
+    # Don't share the parent's pooled HTTPS connections
+    _client_singleton, _spreadsheet, _tweets_ws, _votes_ws = None, None, None, None
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+open_vote_log()
+start_refresh_thread()
 
 if __name__ == '__main__':
+    app.jinja_env.auto_reload = True
     app.run(debug=True) 